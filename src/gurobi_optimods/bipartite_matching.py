@@ -12,6 +12,7 @@ import numpy as np
 import pandas as pd
 import scipy.sparse as sp
 from gurobipy import GRB
+from scipy.sparse import csgraph
 
 try:
     import networkx as nx
@@ -166,6 +167,17 @@ def _maximum_bipartite_matching_scipy(adjacency, nodes1, nodes2, create_env):
         f"n2={nodes2.shape[0]} |E|={adjacency.data.shape[0]}"
     )
 
+    # Every stored entry of the adjacency matrix is an edge, regardless of its
+    # value. If all entries are positive, the matching is found
+    # combinatorially using Hopcroft-Karp, which runs in O(|E| sqrt(|V|)) and
+    # avoids building a model at all. The flow model is kept as a
+    # compatibility fallback for matrices with stored zero or negative
+    # entries: symmetrizing those for Hopcroft-Karp could cancel entries
+    # (and thus drop edges), while the flow model treats them as edges just
+    # like before.
+    if np.all(adjacency.data > 0):
+        return _maximum_bipartite_matching_csgraph(adjacency, nodes1, nodes2)
+
     # Add a source and sink node for max flow formulation
     # Assume G is symmetric (or upper triangular)
     G = sp.triu(adjacency.tocoo())
@@ -217,3 +229,26 @@ def _maximum_bipartite_matching_scipy(adjacency, nodes1, nodes2, create_env):
     arg = (np.ones(from_arc_result.shape), (from_arc_result, to_arc_result))
     matching = sp.coo_array(arg, dtype=float, shape=G.shape)
     return matching + matching.T
+
+
+def _maximum_bipartite_matching_csgraph(adjacency, nodes1, nodes2):
+    """Compute the matching with scipy's Hopcroft-Karp implementation, using
+    the biadjacency matrix between nodes1 (rows) and nodes2 (columns)."""
+
+    # Symmetrize so that edges may be given in either direction
+    adjacency = sp.csr_matrix(adjacency)
+    symmetric = (adjacency + adjacency.T).tocsr()
+    biadjacency = symmetric[nodes1][:, nodes2]
+
+    # match[i] is the column of biadjacency matched to row i, or -1
+    match = csgraph.maximum_bipartite_matching(biadjacency, perm_type="column")
+    matched = match >= 0
+    from_arc_result = nodes1[matched]
+    to_arc_result = nodes2[match[matched]]
+
+    logger.info(f"Done: max bipartite matching has {from_arc_result.shape[0]} edges")
+
+    # Return undirected, unweighted adjacency matrix
+    arg = (np.ones(from_arc_result.shape), (from_arc_result, to_arc_result))
+    matching = sp.coo_array(arg, dtype=float, shape=adjacency.shape)
+    return matching + matching.T
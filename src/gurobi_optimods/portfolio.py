@@ -9,10 +9,32 @@ from typing import Optional
 import gurobipy as gp
 import numpy as np
 import pandas as pd
+import scipy.sparse as sp
 from gurobipy import GRB
+from scipy.sparse import csgraph
 
 from gurobi_optimods.utils import optimod
 
+# Default parameters for the discrete (MIP) variants of the portfolio model,
+# tuned towards finding good portfolios quickly.  Parameters passed by the
+# caller (solver_params, time_limit) take precedence.
+_DEFAULT_PARAMS = {"MIPFocus": 1, "Heuristics": 0.2}
+
+# Portfolio features (keyword arguments of efficient_portfolio) supported by
+# efficient_frontier
+_FRONTIER_FEATURES = (
+    "max_trades",
+    "max_positions",
+    "fees_buy",
+    "fees_sell",
+    "costs_buy",
+    "costs_sell",
+    "min_long",
+    "min_short",
+    "max_total_short",
+    "initial_holdings",
+)
+
 
 class MeanVariancePortfolio:
     """Optimal mean-variance portfolio solver.
@@ -26,8 +48,10 @@ class MeanVariancePortfolio:
     ----------
     mu : 1-d ndarray
         Vector of expected returns for each asset
-    cov_matrix : 2-d ndarray
-        Covariance matrix :math:`\Sigma`
+    cov_matrix : 2-d ndarray or sparray
+        Covariance matrix :math:`\Sigma`.  Sparse matrices, and dense
+        matrices with few nonzero entries, are passed to the solver in sparse
+        format.
     cov_factors : tuple of ndarray
         Covariance factors that constitute :math:`\Sigma = B K B^T + diag(d)`.
 
@@ -38,7 +62,8 @@ class MeanVariancePortfolio:
     Raises
     ------
     LinAlgError
-        If the matrix K is not positive definite
+        If the matrix K is not positive definite, or if the (dense) matrix
+        cov_matrix is not positive semi-definite
 
     """
 
@@ -55,35 +80,79 @@ class MeanVariancePortfolio:
             if isinstance(cov_matrix, pd.DataFrame):
                 self._result_type = "pandas"
                 self._index = cov_matrix.index
-                self._covariance = cov_matrix.to_numpy()
+                self._covariance = _as_float_array(cov_matrix.to_numpy())
             elif isinstance(cov_matrix, np.ndarray):
+                self._covariance = _as_float_array(cov_matrix)
+                self._result_type = "numpy"
+                self._index = None
+            elif sp.issparse(cov_matrix):
                 self._covariance = cov_matrix
                 self._result_type = "numpy"
+                self._index = None
             else:
                 raise TypeError("Incompatible type of cov_matrix")
+            self._covariance = self._prepare_covariance(self._covariance)
         elif cov_factors is not None:
             # Given: (B, K, d) such that Sigma = B @ K @ B.T + diag(d)
-            # Internally we store (F, sqrt(d)) with F = B @ chol(K) so that
+            # Internally we store (F, d) with F = B @ chol(K) so that
             # Sigma = F @ F.T + diag(d)
             #
             # As part of the transformation it is checked whether K is SPD,
             # and we let a possible error from chol propagate.
-            B, K, d = cov_factors
+            B, K, d = map(_as_float_array, cov_factors)
+            if np.any(d < 0):
+                raise ValueError("cov_factors[2] must be nonnegative")
             F = B @ np.linalg.cholesky(K)
-            self._covariance = (F, np.sqrt(d))
+            self._covariance = (F, d if np.any(d > 0) else None)
             self._index = None
         else:
             raise TypeError("No covariace data given")
 
         if isinstance(mu, pd.Series):
             self._result_type = "pandas"
-            self._mu = mu.to_numpy()
+            if self._index is None:
+                self._index = mu.index
+            self._mu = _as_float_array(mu.to_numpy())
         elif isinstance(mu, np.ndarray):
-            self._mu = mu
+            self._mu = _as_float_array(mu)
             self._result_type = "numpy"
         else:
             raise TypeError("Incompatible type of mu")
 
+        n = self._mu.size
+        if self._mu.shape != (n,):
+            raise ValueError("mu must be a 1-d array")
+        if isinstance(self._covariance, tuple):
+            F, d = self._covariance
+            shape_ok = F.shape[0] == n and (d is None or d.shape == (n,))
+        else:
+            shape_ok = self._covariance.shape == (n, n)
+        if not shape_ok:
+            raise ValueError("Dimensions of mu and covariance data do not match")
+
+        self._env = None
+        self._env_params = None
+        self._model_cache = None
+
+    def close(self):
+        """Dispose of the optimization model kept between calls, and of its
+        Gurobi environment (releasing the license).  The instance can still be
+        used afterwards; the next call builds a new model.
+        """
+        if self._model_cache is not None:
+            self._model_cache.model.dispose()
+            self._model_cache = None
+        if self._env is not None:
+            self._env.dispose()
+            self._env = None
+            self._env_params = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
     @optimod()
     def efficient_portfolio(
         self,
@@ -127,10 +196,10 @@ class MeanVariancePortfolio:
         costs_sell : float or ndarray >= 0, optional
             Variable transaction costs for each sell transaction, relative to
             trade value
-        min_long : float >= 0, optional
+        min_long : float or ndarray >= 0, optional
             Lower bound on the volume on a traded long position, relative to
             total portfolio value
-        min_short : float >= 0, optional
+        min_short : float or ndarray >= 0, optional
             Lower bound on the volume on a traded short position, relative to
             total portfolio value
         max_total_short : float >= 0, optional
@@ -165,22 +234,152 @@ class MeanVariancePortfolio:
 
         """
 
+        result = self._solve(
+            create_env,
+            gamma,
+            max_trades,
+            max_positions,
+            fees_buy,
+            fees_sell,
+            costs_buy,
+            costs_sell,
+            min_long,
+            min_short,
+            max_total_short,
+            initial_holdings,
+            rf_return,
+        )
+        if result is None:
+            return None
+        return self._construct_result(*result, rf_return)
+
+    @optimod()
+    def efficient_frontier(self, gammas, *, create_env, **features):
+        """Compute efficient portfolios for a series of risk aversion
+        coefficients
+
+        Parameters
+        ----------
+
+        gammas : float or 1-d array_like of float >= 0
+            Risk aversion cofficients, see
+            :meth:`MeanVariancePortfolio.efficient_portfolio`
+        **features
+            Portfolio features, as keyword arguments of
+            :meth:`MeanVariancePortfolio.efficient_portfolio`.  A risk-free
+            asset (``rf_return``) is not supported.
+
+        Returns
+        -------
+        2-d ndarray or DataFrame
+            The efficient portfolios, one row per value in ``gammas``.  If
+            the portfolio features rule out all possible portfolios, the
+            rows are all NaN.
+
+        Raises
+        ------
+        TypeError
+            If ``features`` contains an unknown portfolio feature
+        ValueError
+            If ``gammas`` has more than one dimension, or if ``features``
+            contains ``rf_return``
+
+        """
+        if "rf_return" in features:
+            raise ValueError(
+                "efficient_frontier does not support a risk-free asset, "
+                "use efficient_portfolio instead"
+            )
+        unknown = sorted(set(features).difference(_FRONTIER_FEATURES))
+        if unknown:
+            raise TypeError("Unknown portfolio features: " + ", ".join(unknown))
+
+        gammas = np.atleast_1d(np.asarray(gammas, dtype=float))
+        if gammas.ndim != 1:
+            raise ValueError("gammas must be a scalar or a 1-d array")
+        frontier = np.full((gammas.size, self._mu.size), np.nan)
+        for i, gamma in enumerate(gammas):
+            result = self._solve(create_env, gamma, warm_start=i > 0, **features)
+            if result is not None:
+                frontier[i] = result[0]
+
+        if self._result_type == "pandas":
+            return pd.DataFrame(frontier, index=gammas, columns=self._index, copy=False)
+        return frontier
+
+    def _solve(
+        self,
+        create_env,
+        gamma,
+        max_trades=None,
+        max_positions=None,
+        fees_buy=None,
+        fees_sell=None,
+        costs_buy=None,
+        costs_sell=None,
+        min_long=None,
+        min_short=None,
+        max_total_short=0.0,
+        initial_holdings=None,
+        rf_return=None,
+        warm_start=False,
+    ):
+        # Solve for the efficient portfolio, and return the pair (x, x_rf) of
+        # solution values, or None if there is no (optimal) solution.  With
+        # warm_start, the solution of the previous call is used as MIP start
+        # if the cached model is reused.
         fees_buy = self._homogenize_input(fees_buy)
         fees_sell = self._homogenize_input(fees_sell)
         costs_buy = self._homogenize_input(costs_buy)
         costs_sell = self._homogenize_input(costs_sell)
         initial_holdings = self._homogenize_input(initial_holdings)
 
+        start_from_holdings = initial_holdings is not None
         if initial_holdings is not None:
             if initial_holdings.sum() > 1.0:
                 raise ValueError("Initial holding's sum must not exceed 1.0")
         else:
             initial_holdings = np.zeros(self._mu.shape)
 
-        with create_env() as env, gp.Model("efficient_portfolio", env=env) as m:
-            x, x_rf = self._populate_model(
+        # Changes in these inputs alter the structure or the constraint matrix
+        # of the model, and require to build a new one.  All other inputs are
+        # updated in the cached model, so that Gurobi can warm-start from the
+        # previous solve.
+        key = (
+            max_trades is None,
+            max_positions is None,
+            rf_return is None,
+            *(
+                _data_key(data)
+                for data in (
+                    fees_buy,
+                    fees_sell,
+                    costs_buy,
+                    costs_sell,
+                    min_long,
+                    min_short,
+                    max_total_short,
+                )
+            ),
+        )
+
+        # The environment is created from the parameters of the call, so that
+        # parameters which only take effect when an environment starts
+        # (licensing, Compute Server, ...) are honored.  The environment and
+        # the model are kept as long as these parameters don't change.
+        env_params = create_env.params()
+        if self._env is None or self._env_params != env_params:
+            self.close()
+            self._env = create_env()
+            self._env_params = env_params
+
+        cache = self._model_cache
+        start = None
+        if cache is None or cache.key != key:
+            self._model_cache = None
+            m = gp.Model("efficient_portfolio", env=self._env)
+            z, zvars, risk, constrs = self._populate_model(
                 m,
-                gamma,
                 max_trades,
                 max_positions,
                 fees_buy,
@@ -193,15 +392,55 @@ class MeanVariancePortfolio:
                 initial_holdings,
                 rf_return,
             )
+            cache = _ModelCache(key, m, z, zvars, risk, constrs)
+            self._model_cache = cache
+
+            # Parameters passed by the caller are set on the environment
+            # already; add the defaults for the remaining ones
+            if "position_long" in zvars or "trade_buy" in zvars:
+                for param, value in _DEFAULT_PARAMS.items():
+                    if param not in env_params:
+                        m.setParam(param, value)
+        else:
+            m = cache.model
+            if warm_start and m.IsMIP and m.SolCount > 0:
+                # Only the objective (gamma) changes along an efficient
+                # frontier, so the previous solution is feasible and usually
+                # close to optimal.
+                start = cache.z.X
+
+            if "trades" in cache.constrs:
+                cache.constrs["trades"].RHS = initial_holdings
+            if max_trades is not None:
+                cache.constrs["max_trades"].RHS = max_trades
+            if max_positions is not None:
+                cache.constrs["max_positions"].RHS = max_positions
+
+        is_mip = "position_long" in cache.zvars or "trade_buy" in cache.zvars
+
+        if start is not None:
+            cache.z.Start = start
+            cache.has_start = True
+        elif is_mip and start_from_holdings:
+            cache.z.Start = _start_vector(cache.zvars, initial_holdings)
+            cache.has_start = True
+        elif cache.has_start:
+            # Discard the MIP start of a previous call on the cached model
+            m.NumStart = 0
+            cache.has_start = False
+
+        x = cache.zvars["x"]
+        x_rf = cache.zvars["x_rf"][0]
+
+        objexpr = self._mu @ x - 0.5 * gamma * cache.risk
+        if rf_return is not None:
+            objexpr += rf_return * x_rf
+        m.setObjective(objexpr, GRB.MAXIMIZE)
 
-            m.optimize()
-            status = m.Status
-            if status == GRB.OPTIMAL:
-                x_vals = x.X
-                x_rf_val = x_rf.X
-
+        m.optimize()
+        status = m.Status
         if status == GRB.OPTIMAL:
-            return self._construct_result(x_vals, x_rf_val, rf_return)
+            return x.X, x_rf.X.item()
         elif status in [GRB.INFEASIBLE, GRB.INF_OR_UNBD]:
             print("No portfolio satisfies the constraints!")
             return None
@@ -211,7 +450,6 @@ class MeanVariancePortfolio:
     def _populate_model(
         self,
         m,
-        gamma,
         max_trades,
         max_positions,
         fees_buy,
@@ -264,126 +502,244 @@ class MeanVariancePortfolio:
         #    b_short \in {0,1} (indicator variable for x_short)
         #    b_buy \in {0,1} (indicator variable for x_buy)
         #    b_sell \in {0,1} (indicator variable for x_sell)
+        #
+        # Only the parts of this model needed for the given portfolio features
+        # are built; see below.
+
+        n = self._mu.size
+        M = 1.0 + max_total_short
+        rf_ub = 0.0 if rf_return is None else 1.0
+
+        # Binaries (and their VUB constraints) are only needed for the
+        # discrete portfolio features; without them the model is a QP.  The
+        # binaries come in pairs to rule out trading (or holding) the same
+        # asset in both directions at once.  Otherwise minimum trade sizes
+        # could be bypassed, and proportional costs could be used to reduce
+        # the invested amount.
+        position_binaries = max_positions is not None
+        trade_binaries = any(
+            data is not None
+            for data in (
+                max_trades,
+                fees_buy,
+                fees_sell,
+                costs_buy,
+                costs_sell,
+                min_long,
+                min_short,
+            )
+        )
+        # x needs to be split in long and short positions only if going short
+        # is allowed.  Otherwise x itself is the (nonnegative) long position,
+        # and the short positions and their binaries are omitted.
+        split_positions = max_total_short != 0.0
+
+        # All variables are stacked into a single vector, so that all linear
+        # constraints can be submitted as one sparse matrix below.
+        #
+        # Portfolio vector x is split into long and short positions, and the
+        # difference to the initial holdings into buy and sell trades.  The
+        # binaries are used to enforce VUB and minimum position/trade size.
+        # Finally, x_rf is a dummy variable for investment in the risk-free
+        # asset.
+        #
+        # Going short by alpha means that each long position (and each trade)
+        # is upper bounded by 1 + alpha, and each short position by alpha.
+        # This is implied by the sum(x) == 1 constraint, but stating these
+        # bounds explicitly for variables in VUB constraints tightens their
+        # relaxation.
+        if split_positions:
+            ub_long, ub_short = GRB.INFINITY, GRB.INFINITY
+            if position_binaries:
+                ub_long, ub_short = M, max_total_short
+            blocks = [("x", n, -GRB.INFINITY, GRB.INFINITY, GRB.CONTINUOUS)]
+            blocks.append(("x_long", n, 0.0, ub_long, GRB.CONTINUOUS))
+            blocks.append(("x_short", n, 0.0, ub_short, GRB.CONTINUOUS))
+        else:
+            ub_long = M if position_binaries else GRB.INFINITY
+            blocks = [("x", n, 0.0, ub_long, GRB.CONTINUOUS)]
+        if trade_binaries:
+            blocks.append(("x_buy", n, 0.0, M, GRB.CONTINUOUS))
+            blocks.append(("x_sell", n, 0.0, M, GRB.CONTINUOUS))
+        if position_binaries:
+            blocks.append(("position_long", n, 0.0, 1.0, GRB.BINARY))
+            if split_positions:
+                blocks.append(("position_short", n, 0.0, 1.0, GRB.BINARY))
+        if trade_binaries:
+            blocks.append(("trade_buy", n, 0.0, 1.0, GRB.BINARY))
+            blocks.append(("trade_sell", n, 0.0, 1.0, GRB.BINARY))
+        factor_risk = isinstance(self._covariance, tuple)
+        if factor_risk:
+            # Auxiliary variables for the factor risk term, see below
+            F, d = self._covariance
+            blocks.append(
+                ("y_F", F.shape[1], -GRB.INFINITY, GRB.INFINITY, GRB.CONTINUOUS)
+            )
+        blocks.append(("x_rf", 1, 0.0, rf_ub, GRB.CONTINUOUS))
 
-        # Portfolio vector x is split into long and short positions
-        x = m.addMVar(shape=self._mu.shape, lb=-float("inf"), name="x")
-        x_long = m.addMVar(shape=self._mu.shape, name="x_long")
-        x_short = m.addMVar(shape=self._mu.shape, name="x_short")
-        m.addConstr(x == x_long - x_short)
-
-        # Dummy variable for investment in risk-free asset,
-        x_rf = m.addVar(lb=0.0, ub=0.0, name="x_rf")
-
-        x_buy = m.addMVar(shape=self._mu.shape, name="x_buy")
-        x_sell = m.addMVar(shape=self._mu.shape, name="x_sell")
-        m.addConstr(x - initial_holdings == x_buy - x_sell)
-
-        # Binaries used to enforce VUB and minimum position/trade size
-        b_long = m.addMVar(shape=self._mu.shape, vtype="B", name="position_long")
-        b_short = m.addMVar(shape=self._mu.shape, vtype="B", name="position_short")
-
-        b_buy = m.addMVar(shape=self._mu.shape, vtype="B", name="trade_buy")
-        b_sell = m.addMVar(shape=self._mu.shape, vtype="B", name="trade_sell")
+        z, zvars = _add_stacked_vars(m, blocks)
+        x = zvars["x"]
 
-        m.update()
+        if position_binaries:
+            # Branch first on positions in assets with large expected return
+            # (either way), as these tend to be decisive for the objective
+            priority = np.argsort(np.argsort(np.abs(self._mu)))
+            zvars["position_long"].BranchPriority = priority
+            if split_positions:
+                zvars["position_short"].BranchPriority = priority
 
-        # Define VUB constraints for x_long and x_short.
-        #
-        # Going short by alpha means that each long position is upper
-        # bounded by 1 + alpha, and each short position by alpha.
-        # This is implied by the sum(x) == 1 constraint.
-        m.addConstr(x_long <= (1.0 + max_total_short) * b_long)
-        m.addConstr(x_short <= max_total_short * b_short)
+        I = sp.eye(n, format="csr")
+        ones = sp.csr_array(np.ones((1, n)))
 
-        m.addConstr(x_buy <= (1.0 + max_total_short) * b_buy)
-        m.addConstr(x_sell <= (1.0 + max_total_short) * b_sell)
+        rows = _StackedRows(zvars)
 
-        # A position/trade cannot be both short and long
-        m.addConstr(b_long + b_short <= 1, name="long_or_short_position")
-        m.addConstr(b_buy + b_sell <= 1, name="buy_or_sell")
+        if split_positions:
+            rows.add("x_split", {"x": I, "x_long": -I, "x_short": I}, GRB.EQUAL, 0.0)
 
-        # Bound total leverage
-        m.addConstr(x_short.sum() <= max_total_short, name="total_short")
+            # Bound total leverage
+            rows.add("total_short", {"x_short": ones}, GRB.LESS_EQUAL, max_total_short)
 
-        investment = x.sum()
+        if trade_binaries:
+            rows.add(
+                "trades",
+                {"x": I, "x_buy": -I, "x_sell": I},
+                GRB.EQUAL,
+                initial_holdings,
+            )
 
-        if max_trades is not None:
-            m.addConstr(b_buy.sum() + b_sell.sum() <= max_trades, name="max_trades")
+        if position_binaries:
+            # Define VUB constraints for x_long and x_short, with the same
+            # bounds as above.
+            rows.add(
+                "vub_long",
+                {"x_long" if split_positions else "x": I, "position_long": -M * I},
+                GRB.LESS_EQUAL,
+                0.0,
+            )
+            positions = {"position_long": ones}
+
+            if split_positions:
+                rows.add(
+                    "vub_short",
+                    {"x_short": I, "position_short": -max_total_short * I},
+                    GRB.LESS_EQUAL,
+                    0.0,
+                )
+
+                # A position cannot be both short and long
+                rows.add(
+                    "long_or_short_position",
+                    {"position_long": I, "position_short": I},
+                    GRB.LESS_EQUAL,
+                    1.0,
+                )
+                positions["position_short"] = ones
+
+            rows.add("max_positions", positions, GRB.LESS_EQUAL, max_positions)
+
+        if trade_binaries:
+            rows.add("vub_buy", {"x_buy": I, "trade_buy": -M * I}, GRB.LESS_EQUAL, 0.0)
+            rows.add(
+                "vub_sell", {"x_sell": I, "trade_sell": -M * I}, GRB.LESS_EQUAL, 0.0
+            )
 
-        if max_positions is not None:
-            m.addConstr(
-                b_long.sum() + b_short.sum() <= max_positions, name="max_positions"
+            # A trade cannot be both buy and sell
+            rows.add(
+                "buy_or_sell", {"trade_buy": I, "trade_sell": I}, GRB.LESS_EQUAL, 1.0
             )
 
+            if max_trades is not None:
+                rows.add(
+                    "max_trades",
+                    {"trade_buy": ones, "trade_sell": ones},
+                    GRB.LESS_EQUAL,
+                    max_trades,
+                )
+
+            if min_long is not None:
+                rows.add(
+                    "min_buy",
+                    {"x_buy": -I, "trade_buy": _diagonal(min_long, n)},
+                    GRB.LESS_EQUAL,
+                    0.0,
+                )
+
+            if min_short is not None:
+                rows.add(
+                    "min_sell",
+                    {"x_sell": -I, "trade_sell": _diagonal(min_short, n)},
+                    GRB.LESS_EQUAL,
+                    0.0,
+                )
+
+        investment = {"x": ones, "x_rf": np.ones((1, 1))}
         if fees_buy is not None:
-            investment += (b_buy * fees_buy).sum()
+            investment["trade_buy"] = _row_vector(fees_buy, n)
         if fees_sell is not None:
-            investment += (b_sell * fees_sell).sum()
-
+            investment["trade_sell"] = _row_vector(fees_sell, n)
         if costs_buy is not None:
-            investment += (x_buy * costs_buy).sum()
+            investment["x_buy"] = _row_vector(costs_buy, n)
         if costs_sell is not None:
-            investment += (x_sell * costs_sell).sum()
-
-        if rf_return is not None:
-            x_rf.ub = 1.0
-            investment += x_rf
-
-        if min_long is not None:
-            m.addConstr(x_buy >= min_long * b_buy, name="min_buy")
-
-        if min_short is not None:
-            m.addConstr(x_sell >= min_short * b_sell, name="min_sell")
+            investment["x_sell"] = _row_vector(costs_sell, n)
+        rows.add("fully_invested", investment, GRB.EQUAL, 1.0)
 
-        m.addConstr(investment == 1, name="fully_invested")
-
-        if not isinstance(self._covariance, tuple):
-            # Basic mean-variance weighted objective
-            objexpr = self._mu @ x - 0.5 * gamma * x @ self._covariance @ x
-        else:
-            F, sqrt_d = self._covariance
-            # We have given Sigma = F @ F.T + diag(sqrt_d) @ diag(sqrt_d)
-            # Auxiliary variables y_F, y_d:
+        if factor_risk:
+            # We have given Sigma = F @ F.T + diag(d)
+            # (where d may be None if Sigma = F @ F.T)
+            # Auxiliary variables y_F:
             #   F.T @ x = y_F
-            #   sqrt_d * x = y_d
-
-            objexpr = self._mu @ x
-
-            y_F = m.addMVar(F.shape[1], lb=-float("inf"), name=f"yF")
-            m.addConstr(F.T @ x == y_F, name=f"link_yF_x")
+            #
+            # so that the risk term has only k + n quadratic terms, instead
+            # of n * n for the full Sigma.
+            rows.add(
+                "link_yF_x",
+                {"x": sp.csr_array(F.T), "y_F": -sp.eye(F.shape[1], format="csr")},
+                GRB.EQUAL,
+                0.0,
+            )
 
-            y_d = m.addMVar(self._mu.size, lb=-float("inf"), name=f"yd")
-            m.addConstr(sqrt_d * x == y_d, name=f"link_yd_x")
+        constrs = rows.submit(m, z)
 
-            objexpr -= 0.5 * gamma * (y_F @ y_F + y_d @ y_d)
+        # The objective is set by the caller, as it is updated in the cached
+        # model; here we only return the quadratic risk term x' * Sigma * x.
+        #
+        # In factor form, the risk term is a sum of squares y_F' * y_F, which
+        # is kept in the objective rather than moved to an epigraph
+        # constraint y_F' * y_F <= t.  The latter makes the model a
+        # (MI)QCP, whose relaxations are solved less efficiently than
+        # convex QPs.
+        if not factor_risk:
+            risk = x @ self._covariance @ x
+        else:
+            y_F = zvars["y_F"]
+            risk = y_F @ y_F
 
-        if rf_return is not None:
-            objexpr += rf_return * x_rf
+            if d is not None:
+                risk += x @ sp.diags(d, format="csr") @ x
 
-        m.setObjective(objexpr, GRB.MAXIMIZE)
-        return (x, x_rf)
+        return (z, zvars, risk, constrs)
 
     def _construct_result(self, x, x_rf, rf_return):
-        if self._result_type == "numpy":
-            pass
-        elif self._result_type == "pandas":
-            x = pd.Series(x, index=self._index)
-        else:
-            assert False
-
         ret = self._mu @ x
 
         if not isinstance(self._covariance, tuple):
             risk = x @ self._covariance @ x
         else:
-            F, sqrt_d = self._covariance
+            F, d = self._covariance
             risk = 0.0
 
             y = x @ F
             risk += y @ y
 
-            y = x * sqrt_d
-            risk += y @ y
+            if d is not None:
+                risk += (x * d) @ x
+
+        if self._result_type == "numpy":
+            pass
+        elif self._result_type == "pandas":
+            x = pd.Series(x, index=self._index, copy=False)
+        else:
+            assert False
 
         if rf_return is not None:
             x_rf = x_rf
@@ -393,6 +749,45 @@ class MeanVariancePortfolio:
 
         return PortfolioResult(x, ret, risk, x_rf)
 
+    @staticmethod
+    def _prepare_covariance(cov_matrix):
+        # Sparse covariance matrices (e.g., from thresholding) are kept in CSR
+        # format, so that only the nonzero terms are passed to the quadratic
+        # objective.  All inputs are symmetrized here once, rather than by
+        # Gurobi on every solve.
+        if (
+            sp.issparse(cov_matrix)
+            or np.count_nonzero(cov_matrix) < 0.25 * cov_matrix.size
+        ):
+            cov_matrix = sp.csr_array(cov_matrix, dtype=np.float64)
+            return sp.csr_array(0.5 * (cov_matrix + cov_matrix.T))
+
+        # A dense Sigma is factored once as Sigma = L @ L.T, and then handled
+        # just like given covariance factors.  This way Gurobi does not need
+        # to check Sigma for positive semi-definiteness on every solve.  If
+        # Sigma is block-diagonal up to a permutation (e.g., uncorrelated
+        # sectors), the blocks are factored separately, so that the factor
+        # is sparse as well.
+        cov_matrix = 0.5 * (cov_matrix + cov_matrix.T)
+        num_blocks, labels = csgraph.connected_components(
+            sp.csr_matrix(cov_matrix), directed=False
+        )
+        try:
+            if num_blocks > 1:
+                return (_blockwise_cholesky(cov_matrix, num_blocks, labels), None)
+            return (np.linalg.cholesky(cov_matrix), None)
+        except np.linalg.LinAlgError:
+            pass
+
+        # Singular covariance matrices can't be factored, but are fine as long
+        # as they are positive semi-definite
+        eigvals = np.linalg.eigvalsh(cov_matrix)
+        if eigvals[0] < -1e-10 * max(1.0, eigvals[-1]):
+            raise np.linalg.LinAlgError(
+                "Covariance matrix is not positive semi-definite"
+            )
+        return cov_matrix
+
     def _homogenize_input(self, input_data):
         # Check and unpack if input_data is a Series
         if isinstance(input_data, pd.Series):
@@ -403,9 +798,173 @@ class MeanVariancePortfolio:
                 self._index = input_data.index
             input_data = input_data.to_numpy()
 
+        if input_data is not None:
+            input_data = _as_float_array(input_data)
         return input_data
 
 
+def _add_stacked_vars(m, blocks):
+    # Add a single MVar holding all variable blocks (name, size, lb, ub, vtype)
+    # consecutively.  Returns the MVar along with a dict of (1-d) views onto
+    # the blocks.
+    names, lb, ub, vtype = [], [], [], []
+    for name, size, block_lb, block_ub, block_vtype in blocks:
+        names.extend(f"{name}[{i}]" for i in range(size))
+        lb.append(np.full(size, block_lb))
+        ub.append(np.full(size, block_ub))
+        vtype.append(np.full(size, block_vtype))
+
+    z = m.addMVar(
+        len(names),
+        lb=np.concatenate(lb),
+        ub=np.concatenate(ub),
+        vtype=np.concatenate(vtype),
+        name=names,
+    )
+
+    zvars = {}
+    offset = 0
+    for name, size, *_ in blocks:
+        zvars[name] = z[offset : offset + size]
+        offset += size
+    return z, zvars
+
+
+def _blockwise_cholesky(cov_matrix, num_blocks, labels):
+    # Sparse factor F with F @ F.T == cov_matrix, where the rows/columns of
+    # cov_matrix are partitioned into num_blocks uncorrelated blocks by labels.
+    # Block k is factored into columns offset, ..., offset + size_k - 1 of F.
+    order = np.argsort(labels, kind="stable")
+    sizes = np.bincount(labels, minlength=num_blocks)
+    rows, cols, vals = [], [], []
+    offset = 0
+    for size in sizes:
+        idx = order[offset : offset + size]
+        L = np.linalg.cholesky(cov_matrix[np.ix_(idx, idx)])
+        i, j = np.tril_indices(size)
+        rows.append(idx[i])
+        cols.append(offset + j)
+        vals.append(L[i, j])
+        offset += size
+    return sp.csr_array(
+        (np.concatenate(vals), (np.concatenate(rows), np.concatenate(cols))),
+        shape=cov_matrix.shape,
+    )
+
+
+def _as_float_array(data):
+    # All numerical data is kept as contiguous float64 arrays, which gurobipy
+    # (and numpy) can consume without further conversion or copies
+    return np.ascontiguousarray(data, dtype=np.float64)
+
+
+def _start_vector(zvars, initial_holdings):
+    # Start values for the stacked variables of _add_stacked_vars, so that
+    # they can be set in a single attribute call.  Use the initial holdings
+    # (i.e., not trading at all) as MIP start.  The investment into the
+    # risk-free asset is left for Gurobi to complete.
+    ih_long = np.clip(initial_holdings, 0.0, None)
+    ih_short = np.clip(-initial_holdings, 0.0, None)
+    starts = {
+        "x": initial_holdings,
+        "x_long": ih_long,
+        "x_short": ih_short,
+        "x_buy": 0.0,
+        "x_sell": 0.0,
+        "position_long": (ih_long > 0).astype(float),
+        "position_short": (ih_short > 0).astype(float),
+        "trade_buy": 0.0,
+        "trade_sell": 0.0,
+    }
+    return np.concatenate(
+        [
+            np.broadcast_to(starts.get(name, GRB.UNDEFINED), (v.size,))
+            for name, v in zvars.items()
+        ]
+    )
+
+
+def _data_key(data):
+    # Hashable representation of scalar or array input data
+    if data is None:
+        return None
+    data = np.asarray(data, dtype=float)
+    return (data.shape, data.tobytes())
+
+
+def _diagonal(data, n):
+    # Scalar or 1-d data as an (n, n) diagonal block of a constraint matrix
+    return sp.diags(np.broadcast_to(data, (n,)), format="csr")
+
+
+def _row_vector(data, n):
+    # Scalar or 1-d data as a (1, n) row of a constraint matrix
+    return sp.csr_array(np.broadcast_to(data, (n,)).reshape(1, n))
+
+
+class _StackedRows:
+    # Collects blocks of linear constraints over the stacked variables from
+    # _add_stacked_vars, and submits them in a single addMConstr call.  Each
+    # block of rows is given as a dict mapping variable block names to the
+    # coefficient matrices of that variable block.  The resulting constraints
+    # are returned as a dict of MConstr, keyed by block name.
+
+    def __init__(self, zvars):
+        self._sizes = {name: v.size for name, v in zvars.items()}
+        self._blocks = []
+
+    def add(self, name, coeffs, sense, rhs):
+        nrows = next(iter(coeffs.values())).shape[0]
+        self._blocks.append((name, nrows, coeffs, sense, rhs))
+
+    def submit(self, m, z):
+        matrices, senses, rhs, names = [], [], [], []
+        for name, nrows, coeffs, sense, block_rhs in self._blocks:
+            matrices.append(
+                sp.hstack(
+                    [
+                        coeffs[vname]
+                        if vname in coeffs
+                        else sp.csr_array((nrows, size))
+                        for vname, size in self._sizes.items()
+                    ]
+                )
+            )
+            senses.append(np.full(nrows, sense))
+            rhs.append(np.broadcast_to(block_rhs, (nrows,)))
+            if nrows == 1:
+                names.append(name)
+            else:
+                names.extend(f"{name}[{i}]" for i in range(nrows))
+
+        A = sp.vstack(matrices, format="csr")
+        A.eliminate_zeros()
+        constrs = m.addMConstr(
+            A, z, np.concatenate(senses), np.concatenate(rhs), name=names
+        )
+
+        # Return the constraints of each block, for later modification
+        blocks = {}
+        offset = 0
+        for name, nrows, *_ in self._blocks:
+            blocks[name] = constrs[offset : offset + nrows]
+            offset += nrows
+        return blocks
+
+
+@dataclass
+class _ModelCache:
+    # Model of the most recent call to efficient_portfolio, along with the
+    # handles needed to update it
+    key: tuple
+    model: gp.Model
+    z: gp.MVar
+    zvars: dict
+    risk: gp.MQuadExpr
+    constrs: dict
+    has_start: bool = False
+
+
 @dataclass
 class PortfolioResult:
     """
@@ -16,6 +16,10 @@ The mod then gets some arguments for free:
 Parameters can also be passed as a dictionary to create_env if the Mod requires
 some specific settings.
 
+Mods which keep a model alive across calls can obtain the final parameter
+dictionary from create_env.params(params=None) without creating an environment,
+e.g., to decide whether the environment of a previous call can be reused.
+
 Note that this captures output via the gurobipy and optimod python loggers. It
 may not work as expected when multithreading in Python.
 """
@@ -89,15 +93,21 @@ def _mod_context(
     if time_limit is not None:
         user_params["TimeLimit"] = float(time_limit)
 
-    # Environment factory for decorated mod to use
-    def create_env(params=None):
+    # Parameters for the decorated mod's environments, in order of precedence
+    def env_params(params=None):
         final_params = {}
         final_params.update(decorator_params)
         if params:
             final_params.update(params)
         if user_params:
             final_params.update(user_params)
-        return gp.Env(params=final_params)
+        return final_params
+
+    # Environment factory for decorated mod to use
+    def create_env(params=None):
+        return gp.Env(params=env_params(params))
+
+    create_env.params = env_params
 
     try:
         yield create_env
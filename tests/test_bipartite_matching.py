@@ -34,7 +34,7 @@ class TestBipartiteMatchingScipySparse(unittest.TestCase):
         assert_allclose(matching.data, np.ones(matching.data.shape))
         adj = matching.todense()
         assert_allclose(adj, adj.T)
-        self.assertTrue(np.alltrue(adj.sum(axis=0) <= 1))
+        self.assertTrue(np.all(adj.sum(axis=0) <= 1))
 
     def test_empty(self):
         # Matching of an empty graph is empty
@@ -159,6 +159,19 @@ class TestBipartiteMatchingScipySparse(unittest.TestCase):
         self.assertEqual(matching.shape, adjacency.shape)
         self.assert_is_unweighted_matching(matching)
 
+    def test_flow_model(self):
+        # Stored non-positive entries are still edges; they are solved with
+        # the flow model, and the matching has the same size as the one found
+        # by Hopcroft-Karp
+        adjacency, nodes1, nodes2 = random_bipartite(n1=20, n2=15, p=0.2, seed=7741)
+
+        matching = maximum_bipartite_matching(adjacency, nodes1, nodes2)
+        matching_flow = maximum_bipartite_matching(-adjacency, nodes1, nodes2)
+
+        self.assert_is_unweighted_matching(matching)
+        self.assert_is_unweighted_matching(matching_flow)
+        self.assertEqual(matching.nnz, matching_flow.nnz)
+
 
 class TestBipartiteMatchingPandas(unittest.TestCase):
     def assert_is_unweighted_matching(self, matching, columns):
@@ -6,6 +6,7 @@ from contextlib import redirect_stdout
 
 import numpy as np
 import pandas as pd
+import scipy.sparse as sp
 from numpy.testing import assert_allclose, assert_array_equal
 
 from gurobi_optimods.datasets import load_portfolio
@@ -108,6 +109,271 @@ class TestMVPBasic(unittest.TestCase):
         with self.assertRaises(np.linalg.LinAlgError):
             mvp = MeanVariancePortfolio(mu, cov_factors=(B, K, d))
 
+    def test_init_negative_d(self):
+        # cov_factors[2] must be nonnegative
+        B = np.random.rand(8, 2)
+        K = np.eye(2)
+        d = np.ones(8)
+        d[3] = -1.0
+        mu = np.ones(8)
+
+        with self.assertRaises(ValueError):
+            mvp = MeanVariancePortfolio(mu, cov_factors=(B, K, d))
+
+    def test_init_6(self):
+        # cov_matrix must be positive semi-definite, this is indefinite
+        cov_matrix = np.array([[1.0, 2.0], [2.0, 1.0]])
+        mu = np.ones(2)
+
+        with self.assertRaises(np.linalg.LinAlgError):
+            mvp = MeanVariancePortfolio(mu, cov_matrix)
+
+    def test_init_7(self):
+        # Singular cov_matrix is fine
+        cov_matrix = np.array([[1.0, 1.0], [1.0, 1.0]])
+        mu = np.array([1.0, 0.5])
+        mvp = MeanVariancePortfolio(mu, cov_matrix)
+        pf = mvp.efficient_portfolio(1.0, verbose=False)
+        assert_allclose(pf.x, [1.0, 0.0], atol=1e-6)
+
+    def test_init_dimensions(self):
+        # Dimensions of mu and covariance data must match
+        cov_matrix = np.eye(3)
+        with self.assertRaises(ValueError):
+            mvp = MeanVariancePortfolio(np.ones(4), cov_matrix)
+        with self.assertRaises(ValueError):
+            mvp = MeanVariancePortfolio(np.ones((3, 1)), cov_matrix)
+        with self.assertRaises(ValueError):
+            mvp = MeanVariancePortfolio(
+                np.ones(4), cov_factors=(np.ones((3, 1)), np.eye(1), np.ones(3))
+            )
+
+    def test_init_dtypes(self):
+        # Integer and object data is converted to float64 arrays
+        cov_matrix = pd.DataFrame(
+            [[3, 1], [1, 2]], index=["a", "b"], columns=["a", "b"], dtype=object
+        )
+        mu = pd.Series([1, 0], index=["a", "b"])
+        mvp = MeanVariancePortfolio(mu, cov_matrix)
+        pf = mvp.efficient_portfolio(1.0, verbose=False)
+        self.assertEqual(pf.x.dtype, np.float64)
+        self.assertAlmostEqual(pf.x.sum(), 1.0)
+
+    def test_init_sparse(self):
+        # Sparse covariance matrices are accepted in any format
+        cov_matrix = np.diag([3.0, 2.0, 1.0])
+        mu = np.ones(3)
+        x_dense = MeanVariancePortfolio(mu, cov_matrix).efficient_portfolio(1.0).x
+        mvp = MeanVariancePortfolio(mu, sp.coo_array(cov_matrix))
+        assert_allclose(mvp.efficient_portfolio(1.0).x, x_dense, atol=1e-6)
+
+    def test_model_reuse(self):
+        # Repeated solves with updated data reuse the model (the default
+        # parameters of a new MIP model are set only once), and give the
+        # same portfolios as a fresh instance
+        data = load_portfolio()
+        cov_matrix = data.cov()
+        mu = data.mean()
+        x0 = 1.0 / mu.size * np.ones(mu.size)
+
+        mvp = MeanVariancePortfolio(mu, cov_matrix)
+        with redirect_stdout(io.StringIO()) as console:
+            mvp.efficient_portfolio(100.0, max_trades=5)
+            for gamma, max_trades, initial_holdings in [
+                (50.0, 3, None),
+                (100.0, 4, x0),
+                (10.0, 2, x0),
+            ]:
+                x = mvp.efficient_portfolio(
+                    gamma, max_trades=max_trades, initial_holdings=initial_holdings
+                ).x
+
+                x_fresh = (
+                    MeanVariancePortfolio(mu, cov_matrix)
+                    .efficient_portfolio(
+                        gamma,
+                        max_trades=max_trades,
+                        initial_holdings=initial_holdings,
+                        verbose=False,
+                    )
+                    .x
+                )
+                assert_allclose(x, x_fresh, atol=1e-6)
+        self.assertEqual(console.getvalue().count("Set parameter MIPFocus"), 1)
+
+        # Structural changes require a new model
+        with redirect_stdout(io.StringIO()) as console:
+            mvp.efficient_portfolio(100.0, max_positions=5)
+        self.assertIn("Set parameter MIPFocus", console.getvalue())
+
+    def test_continuous_model(self):
+        # Without discrete portfolio features, no binaries are needed
+        data = load_portfolio()
+        cov_matrix = data.cov()
+        mu = data.mean()
+
+        mvp = MeanVariancePortfolio(mu, cov_matrix)
+        with redirect_stdout(io.StringIO()) as console:
+            mvp.efficient_portfolio(100.0, max_total_short=0.1)
+        self.assertNotIn("binary", console.getvalue())
+
+        with redirect_stdout(io.StringIO()) as console:
+            mvp.efficient_portfolio(100.0, max_positions=3)
+        self.assertIn("binary", console.getvalue())
+
+        with redirect_stdout(io.StringIO()) as console:
+            mvp.efficient_portfolio(100.0, costs_buy=0.01)
+        self.assertIn("binary", console.getvalue())
+
+    def test_long_only_model(self):
+        # Without going short there are no binaries for short positions, and
+        # the portfolio is the same
+        data = load_portfolio()
+        cov_matrix = data.cov()
+        mu = data.mean()
+
+        mvp = MeanVariancePortfolio(mu, cov_matrix)
+        with redirect_stdout(io.StringIO()) as console:
+            x = mvp.efficient_portfolio(100.0, max_positions=3).x
+        self.assertIn(f"({mu.size} binary)", console.getvalue())
+        self.assertLessEqual((x > 1e-6).sum(), 3)
+
+        with redirect_stdout(io.StringIO()) as console:
+            x_split = mvp.efficient_portfolio(
+                100.0, max_positions=3, max_total_short=1e-8
+            ).x
+        self.assertIn(f"({2 * mu.size} binary)", console.getvalue())
+        assert_allclose(x, x_split, atol=1e-6)
+
+    def test_mip_start(self):
+        # Initial holdings are used as MIP start
+        data = load_portfolio()
+        cov_matrix = data.cov()
+        mu = data.mean()
+        x0 = 1.0 / mu.size * np.ones(mu.size)
+
+        mvp = MeanVariancePortfolio(mu, cov_matrix)
+        with redirect_stdout(io.StringIO()) as console:
+            mvp.efficient_portfolio(
+                100.0,
+                max_positions=mu.size,
+                max_total_short=0.1,
+                initial_holdings=x0,
+            )
+        self.assertIn("User MIP start produced solution", console.getvalue())
+
+        # The start is dropped when the cached model is solved without
+        # initial holdings
+        with redirect_stdout(io.StringIO()) as console:
+            mvp.efficient_portfolio(100.0, max_positions=mu.size, max_total_short=0.1)
+        self.assertNotIn("User MIP start", console.getvalue())
+
+    def test_no_mip_start(self):
+        # Without initial holdings, no (empty) MIP start is set
+        data = load_portfolio()
+        cov_matrix = data.cov()
+        mu = data.mean()
+
+        mvp = MeanVariancePortfolio(mu, cov_matrix)
+        with redirect_stdout(io.StringIO()) as console:
+            mvp.efficient_portfolio(100.0, max_positions=5)
+        self.assertNotIn("MIP start", console.getvalue())
+
+    def test_env(self):
+        # Parameters of a call don't leak into other instances or later calls
+        # with different parameters
+        data = load_portfolio()
+        cov_matrix = data.cov()
+        mu = data.mean()
+
+        mvp1 = MeanVariancePortfolio(mu, cov_matrix)
+        mvp2 = MeanVariancePortfolio(mu, cov_matrix)
+        with redirect_stdout(io.StringIO()) as console:
+            mvp1.efficient_portfolio(0.5, solver_params={"MIPFocus": 2})
+        self.assertIn("Set parameter MIPFocus to value 2", console.getvalue())
+
+        with redirect_stdout(io.StringIO()) as console:
+            mvp2.efficient_portfolio(0.5, verbose=False)
+            mvp1.efficient_portfolio(0.5, verbose=False)
+        self.assertEqual(console.getvalue(), "")
+
+        with redirect_stdout(io.StringIO()) as console:
+            mvp1.efficient_portfolio(0.5, max_positions=3)
+        self.assertNotIn("MIPFocus to value 2", console.getvalue())
+
+        # With the same parameters, the model (and its parameters) are reused
+        with redirect_stdout(io.StringIO()) as console:
+            mvp1.efficient_portfolio(1.0, max_positions=3)
+        self.assertNotIn("Set parameter", console.getvalue())
+
+    def test_close(self):
+        # The cached model and its environment can be released explicitly,
+        # and the instance remains usable
+        data = load_portfolio()
+        cov_matrix = data.cov()
+        mu = data.mean()
+
+        with MeanVariancePortfolio(mu, cov_matrix) as mvp:
+            x = mvp.efficient_portfolio(0.5, max_positions=3, verbose=False).x
+            mvp.close()
+            mvp.close()
+
+            with redirect_stdout(io.StringIO()) as console:
+                x_again = mvp.efficient_portfolio(0.5, max_positions=3).x
+            self.assertIn("Set parameter MIPFocus", console.getvalue())
+            assert_allclose(x, x_again, atol=1e-6)
+
+        x_again = mvp.efficient_portfolio(0.5, max_positions=3, verbose=False).x
+        assert_allclose(x, x_again, atol=1e-6)
+        mvp.close()
+
+    def test_env_params(self):
+        # Parameters which can only be set when an environment starts are
+        # accepted in later calls, too
+        data = load_portfolio()
+        cov_matrix = data.cov()
+        mu = data.mean()
+
+        mvp = MeanVariancePortfolio(mu, cov_matrix)
+        x = mvp.efficient_portfolio(0.5, verbose=False).x
+        with redirect_stdout(io.StringIO()) as console:
+            x_timeout = mvp.efficient_portfolio(
+                0.5, solver_params={"ServerTimeout": 30}
+            ).x
+        self.assertIn("Set parameter ServerTimeout to value 30", console.getvalue())
+        assert_allclose(x, x_timeout, atol=1e-6)
+
+    def test_default_params(self):
+        # Default parameters apply to MIP models unless overridden, and are
+        # set only once on a reused model
+        data = load_portfolio()
+        cov_matrix = data.cov()
+        mu = data.mean()
+
+        mvp = MeanVariancePortfolio(mu, cov_matrix)
+        with redirect_stdout(io.StringIO()) as console:
+            mvp.efficient_portfolio(0.5, max_positions=3)
+            mvp.efficient_portfolio(1.0, max_positions=3)
+        console_content = console.getvalue()
+        self.assertEqual(console_content.count("Set parameter MIPFocus to value 1"), 1)
+        self.assertEqual(
+            console_content.count("Set parameter Heuristics to value 0.2"), 1
+        )
+
+        with redirect_stdout(io.StringIO()) as console:
+            mvp.efficient_portfolio(
+                1.0, max_positions=3, solver_params={"Heuristics": 0.0}
+            )
+        console_content = console.getvalue()
+        self.assertIn("Set parameter Heuristics to value 0", console_content)
+        self.assertNotIn("Heuristics to value 0.2", console_content)
+        self.assertIn("Set parameter MIPFocus to value 1", console_content)
+
+        # The continuous model keeps Gurobi's defaults
+        with redirect_stdout(io.StringIO()) as console:
+            mvp.efficient_portfolio(1.0)
+        self.assertNotIn("MIPFocus", console.getvalue())
+
     def test_outputflag(self):
         data = load_portfolio()
         cov_matrix = data.cov()
@@ -188,6 +454,124 @@ class TestMVPFeatures(unittest.TestCase):
         pf = mvp.efficient_portfolio(0.5)
         self.assertAlmostEqual(pf.ret, pf.x @ mu)
 
+    def test_single_asset(self):
+        mu = np.array([0.1])
+        for mvp in (
+            MeanVariancePortfolio(mu, np.array([[0.04]])),
+            MeanVariancePortfolio(
+                mu, cov_factors=(np.array([[0.2]]), np.eye(1), np.zeros(1))
+            ),
+        ):
+            pf = mvp.efficient_portfolio(1.0)
+            assert_allclose(pf.x, [1.0], atol=1e-6)
+            pf = mvp.efficient_portfolio(1.0, max_positions=1, rf_return=0.05)
+            assert_allclose(pf.x, [1.0], atol=1e-6)
+            self.assertAlmostEqual(pf.x_rf, 0.0, delta=1e-6)
+
+    def test_sparse_equivalent(self):
+        # Sparse and dense representations of Sigma give the same portfolio
+        cov_matrix = np.diag([3.0, 2.0, 1.0, 4.0])
+        cov_matrix[0, 1] = cov_matrix[1, 0] = 0.5
+        mu = np.array([1.0, -0.1, 0.2, 0.5])
+
+        x_dense = MeanVariancePortfolio(mu, cov_matrix).efficient_portfolio(0.5).x
+        pf = MeanVariancePortfolio(mu, sp.csr_array(cov_matrix)).efficient_portfolio(
+            0.5
+        )
+
+        assert_allclose(pf.x, x_dense, atol=1e-6)
+        self.assertAlmostEqual(pf.risk, pf.x @ cov_matrix @ pf.x)
+
+    def test_block_diagonal(self):
+        # Uncorrelated blocks (here: interleaved sectors of the example data)
+        # give the same portfolio as the sparse representation of Sigma
+        data = load_portfolio()
+        cov_matrix = data.cov()
+        mu = data.mean()
+        sector = np.arange(mu.size) % 2
+        cov_matrix[sector[:, None] != sector[None, :]] = 0.0
+
+        mvp = MeanVariancePortfolio(mu, cov_matrix)
+        pf = mvp.efficient_portfolio(100.0, max_positions=3)
+        x_sparse = (
+            MeanVariancePortfolio(mu, sp.csr_array(cov_matrix.to_numpy()))
+            .efficient_portfolio(100.0, max_positions=3)
+            .x
+        )
+        assert_allclose(pf.x, x_sparse, atol=1e-6)
+        self.assertAlmostEqual(pf.risk, pf.x @ cov_matrix @ pf.x)
+
+    def test_efficient_frontier(self):
+        data = load_portfolio()
+        cov_matrix = data.cov()
+        mu = data.mean()
+        gammas = [1.0, 10.0, 100.0]
+
+        mvp = MeanVariancePortfolio(mu, cov_matrix)
+        frontier = mvp.efficient_frontier(gammas, max_total_short=0.1)
+        self.assertIsInstance(frontier, pd.DataFrame)
+        self.assertEqual(frontier.shape, (3, mu.size))
+        assert_array_equal(frontier.columns, mu.index)
+
+        for gamma, x in frontier.iterrows():
+            x_single = mvp.efficient_portfolio(gamma, max_total_short=0.1).x
+            assert_allclose(x, x_single, atol=1e-6)
+
+    def test_efficient_frontier_warm_start(self):
+        # Each MIP is started from the solution for the previous gamma
+        data = load_portfolio()
+        cov_matrix = data.cov()
+        mu = data.mean()
+        gammas = [1.0, 10.0, 100.0]
+
+        mvp = MeanVariancePortfolio(mu, cov_matrix)
+        with redirect_stdout(io.StringIO()) as console:
+            frontier = mvp.efficient_frontier(gammas, max_positions=3)
+        self.assertEqual(
+            console.getvalue().count("Loaded user MIP start"),
+            len(gammas) - 1,
+        )
+
+        for gamma, x in frontier.iterrows():
+            x_single = mvp.efficient_portfolio(gamma, max_positions=3, verbose=False).x
+            assert_allclose(x, x_single, atol=1e-6)
+
+    def test_efficient_frontier_numpy(self):
+        cov_matrix = np.array([[3, 0.5], [0.5, 2]])
+        mu = np.array([1, -0.1])
+        mvp = MeanVariancePortfolio(mu, cov_matrix)
+        frontier = mvp.efficient_frontier([0.5, 0.5], max_positions=2)
+        self.assertIsInstance(frontier, np.ndarray)
+        assert_allclose(frontier, [[0.925, 0.075], [0.925, 0.075]], atol=1e-6)
+
+    def test_efficient_frontier_scalar(self):
+        cov_matrix = np.array([[3, 0.5], [0.5, 2]])
+        mu = np.array([1, -0.1])
+        mvp = MeanVariancePortfolio(mu, cov_matrix)
+        frontier = mvp.efficient_frontier(0.5)
+        assert_allclose(frontier, [[0.925, 0.075]], atol=1e-6)
+
+    def test_efficient_frontier_invalid(self):
+        cov_matrix = np.array([[3, 0.5], [0.5, 2]])
+        mu = np.array([1, -0.1])
+        mvp = MeanVariancePortfolio(mu, cov_matrix)
+        with self.assertRaises(ValueError):
+            mvp.efficient_frontier([0.5, 1.0], rf_return=0.01)
+        with self.assertRaises(TypeError):
+            mvp.efficient_frontier([0.5, 1.0], warm_start=False)
+        with self.assertRaises(ValueError):
+            mvp.efficient_frontier([[0.5, 1.0]])
+
+    def test_efficient_frontier_infeasible(self):
+        cov_matrix = np.array([[3, 0.5], [0.5, 2]])
+        mu = np.array([1, -0.1])
+        mvp = MeanVariancePortfolio(mu, cov_matrix)
+        x0 = np.array([0.5, 0.5])
+        frontier = mvp.efficient_frontier(
+            [0.5], initial_holdings=x0, max_positions=1, max_trades=0
+        )
+        self.assertTrue(np.isnan(frontier).all())
+
     def test_two_assets_risk(self):
         cov_matrix = np.array([[3, 0.5], [0.5, 2]])
         mu = np.array([1, -0.1])
@@ -272,6 +656,25 @@ class TestMVPFeatures(unittest.TestCase):
         small_trades = (x > 1e-6) & (x < (0.03 - 1e-6))
         self.assertEqual(small_trades.sum(), 0)
 
+    def test_min_long_per_asset(self):
+        data = load_portfolio()
+        cov_matrix = data.cov()
+        mu = data.mean()
+        gamma = 100.0
+
+        mvp = MeanVariancePortfolio(mu, cov_matrix)
+
+        # A scalar threshold is the same as an array of equal thresholds
+        x_scalar = mvp.efficient_portfolio(gamma, min_long=0.03).x
+        x = mvp.efficient_portfolio(gamma, min_long=np.full(mu.size, 0.03)).x
+        assert_allclose(x.to_numpy(), x_scalar.to_numpy(), atol=1e-6)
+
+        # Thresholds are applied per asset
+        min_long = np.where(np.arange(mu.size) % 2 == 0, 0.05, 0.0)
+        x = mvp.efficient_portfolio(gamma, min_long=min_long).x
+        small_trades = (x > 1e-6) & (x < (min_long - 1e-6))
+        self.assertEqual(small_trades.sum(), 0)
+
     def test_max_total_short(self):
         data = load_portfolio()
         cov_matrix = data.cov()
@@ -289,7 +692,7 @@ class TestMVPFeatures(unittest.TestCase):
         self.assertGreaterEqual(x[x < 0].sum(), -0.1 - 1e-6)
         self.assertLess(x[x < 0].sum(), -1e-3)
         self.assertAlmostEqual(x.sum(), 1.0)
-        self.assertAlmostEqual(np.abs(x).sum(), 1.0 + 2 * 0.1)
+        self.assertAlmostEqual(np.abs(x).sum(), 1.0 + 2 * 0.1, delta=1e-6)
 
     def test_min_short_0(self):
         data = load_portfolio()
@@ -305,7 +708,7 @@ class TestMVPFeatures(unittest.TestCase):
 
         # Adding a min_short constraint doesn't change a thing
         x_other = mvp.efficient_portfolio(gamma, min_short=0.01).x
-        assert_allclose(x.to_numpy(), x_other.to_numpy())
+        assert_allclose(x.to_numpy(), x_other.to_numpy(), atol=1e-6)
 
     def test_min_short_1(self):
         data = load_portfolio()
@@ -336,7 +739,7 @@ class TestMVPFeatures(unittest.TestCase):
         x0 = np.zeros(mu.shape)
         x_with = mvp.efficient_portfolio(gamma, initial_holdings=x0).x
         x_without = mvp.efficient_portfolio(gamma, initial_holdings=None).x
-        assert_array_equal(x_with, x_without)
+        assert_allclose(x_with, x_without, atol=1e-6)
 
     def test_start_portfolio_invalid(self):
         data = load_portfolio()
@@ -150,6 +150,16 @@ class TestOverrideParams(unittest.TestCase):
         self.assertEqual(buffer_stdout.getvalue(), "")
         self.assertEqual(buffer_stderr.getvalue(), "")
 
+    def test_params_dict(self):
+        # The final parameters are available without creating an environment
+
+        @optimod()
+        def mod(*, create_env):
+            return create_env.params(params={"OutputFlag": 0, "MIPFocus": 1})
+
+        params = mod(solver_params={"MIPFocus": 2})
+        self.assertEqual(params, {"OutputFlag": 0, "MIPFocus": 2})
+
     def test_user_override_worklimit(self):
         # The user can pass through parameters which take precedence
 